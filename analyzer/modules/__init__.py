@@ -1 +1,27 @@
 # Package Manager Modules
+import sys
+
+# Modo silencioso: suprime as mensagens de progresso (ex.: execução via orchestrator)
+_quiet = False
+
+
+def set_quiet(quiet: bool) -> None:
+    """Ativa ou desativa as mensagens de progresso dos coletores"""
+    global _quiet
+    _quiet = bool(quiet)
+
+
+def log(message: str = "") -> None:
+    """Imprime uma mensagem de progresso, a menos que o modo silencioso esteja ativo"""
+    if not _quiet:
+        sys.stdout.write(message + "\n")
+
+
+def warn(message: str) -> None:
+    """Imprime um aviso (não é suprimido pelo modo silencioso)
+    
+    Mensagem e quebra de linha vão em uma única escrita, para que avisos de
+    coletores rodando em threads diferentes não se misturem na mesma linha.
+    """
+    sys.stdout.write(message + "\n")
+    sys.stdout.flush()
@@ -0,0 +1,136 @@
+"""
+Acesso compartilhado à API Python da libdnf5
+
+Uma única Base é carregada por execução e reutilizada por todos os módulos,
+evitando que cada `dnf ...` em subprocess recarregue plugins, metadados dos
+repositórios e o solver. Se a libdnf5 não estiver disponível (ou falhar ao
+inicializar), `available()` retorna False e os módulos usam a CLI do dnf.
+"""
+import threading
+from typing import Any, Dict, List, Optional
+
+try:
+    import libdnf5
+except ImportError:
+    libdnf5 = None
+
+from . import warn
+
+_base = None
+_base_failed = False
+# A Base não é thread-safe e os coletores rodam em paralelo
+_lock = threading.RLock()
+
+
+def get_base() -> Optional[Any]:
+    """Retorna a Base compartilhada, inicializando na primeira chamada"""
+    global _base, _base_failed
+    
+    if libdnf5 is None:
+        return None
+    
+    with _lock:
+        if _base is None and not _base_failed:
+            try:
+                base = libdnf5.base.Base()
+                base.load_config_from_file()
+                base.setup()
+                
+                repo_sack = base.get_repo_sack()
+                repo_sack.create_repos_from_system_configuration()
+                # True: carregar também o repositório do sistema (instalados)
+                repo_sack.update_and_load_enabled_repos(True)
+                
+                _base = base
+            except Exception as e:
+                warn(f"⚠️ libdnf5 indisponível, usando CLI do dnf: {e}")
+                _base_failed = True
+        
+        return _base
+
+
+def available() -> bool:
+    """Indica se as consultas podem ser feitas via libdnf5"""
+    return get_base() is not None
+
+
+def _package_to_dict(pkg: Any) -> Dict[str, Any]:
+    """Extrai os campos usados pelos módulos de um libdnf5.rpm.Package"""
+    return {
+        "name": pkg.get_name(),
+        "evr": pkg.get_evr(),
+        "version": pkg.get_version(),
+        "nevra": pkg.get_nevra(),
+        "repo_id": pkg.get_repo_id(),
+        "from_repo_id": pkg.get_from_repo_id(),
+        "install_size": pkg.get_install_size(),
+        "summary": pkg.get_summary(),
+        "url": pkg.get_url()
+    }
+
+
+def _query(*filters: str) -> List[Dict[str, Any]]:
+    """Executa uma PackageQuery aplicando os filtros `filter_<nome>` em ordem"""
+    base = get_base()
+    
+    with _lock:
+        query = libdnf5.rpm.PackageQuery(base)
+        for name in filters:
+            getattr(query, f"filter_{name}")()
+        return [_package_to_dict(pkg) for pkg in query]
+
+
+def installed_query() -> List[Dict[str, Any]]:
+    """Pacotes instalados"""
+    return _query("installed")
+
+
+def upgrades_query() -> List[Dict[str, Any]]:
+    """Versão mais nova disponível de cada pacote com atualização"""
+    return _query("upgrades", "latest_evr")
+
+
+def userinstalled_query() -> List[Dict[str, Any]]:
+    """Pacotes instalados explicitamente pelo usuário"""
+    return _query("installed", "userinstalled")
+
+
+def unneeded_query() -> List[Dict[str, Any]]:
+    """Pacotes instalados que não são mais necessários (autoremove)"""
+    return _query("installed", "unneeded")
+
+
+def duplicates_query() -> List[Dict[str, Any]]:
+    """Pacotes instalados em mais de uma versão"""
+    return _query("installed", "duplicates")
+
+
+def info_query(package_name: str) -> Optional[Dict[str, Any]]:
+    """Informações da versão mais nova conhecida de um pacote (instalada ou disponível)"""
+    base = get_base()
+    
+    with _lock:
+        query = libdnf5.rpm.PackageQuery(base)
+        query.filter_name([package_name])
+        query.filter_latest_evr()
+        
+        packages = [_package_to_dict(pkg) for pkg in query]
+        return packages[0] if packages else None
+
+
+def security_advisories() -> List[Dict[str, Any]]:
+    """Advisories de segurança que se aplicam a pacotes instalados"""
+    base = get_base()
+    
+    with _lock:
+        installed = libdnf5.rpm.PackageQuery(base)
+        installed.filter_installed()
+        
+        advisories = libdnf5.advisory.AdvisoryQuery(base)
+        advisories.filter_type("security")
+        advisories.filter_packages(installed, libdnf5.common.QueryCmp_GT)
+        
+        return [
+            {"name": adv.get_name(), "severity": adv.get_severity() or "unknown"}
+            for adv in advisories
+        ]
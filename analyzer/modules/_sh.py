@@ -0,0 +1,83 @@
+"""
+Utilitários compartilhados para execução de comandos externos
+"""
+import os
+import signal
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+
+# Máximo de processos dnf/rpm simultâneos. Os coletores rodam em paralelo
+# (e cada um dispara várias consultas), mas vários dnf carregando metadados
+# ao mesmo tempo só disputam CPU e disco
+MAX_CONCURRENT_PROCESSES = 4
+
+_process_slots = threading.BoundedSemaphore(MAX_CONCURRENT_PROCESSES)
+
+
+def run_parallel(tasks: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """Executa tarefas independentes em paralelo e retorna resultados por tag
+
+    As tarefas são, na prática, esperas por dnf/rpm em subprocess, então
+    threads bastam para sobrepor o tempo de espera (o mesmo vale para os
+    coletores em `collect_all_metrics`). Exceções são propagadas.
+    """
+    if not tasks:
+        return {}
+    
+    with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+        futures = {tag: executor.submit(task) for tag, task in tasks.items()}
+        return {tag: future.result() for tag, future in futures.items()}
+
+
+def run(*args: Any, **kwargs: Any) -> subprocess.CompletedProcess:
+    """subprocess.run limitado a MAX_CONCURRENT_PROCESSES processos simultâneos"""
+    with _process_slots:
+        return subprocess.run(*args, **kwargs)
+
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    """Mata o grupo de processos do comando (filhos que herdaram o pipe inclusos)"""
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def iter_lines(cmd: List[str], timeout: int, ok_returncodes: Sequence[int] = (0,)) -> Iterator[str]:
+    """Executa o comando e gera as linhas do stdout à medida que são escritas
+
+    Evita manter a saída inteira em memória (e ainda uma cópia dividida em
+    linhas). O processo é encerrado se exceder `timeout` segundos; timeout ou
+    código de saída fora de `ok_returncodes` levantam exceção ao final.
+    
+    O comando roda em uma sessão própria e o timeout mata o grupo inteiro:
+    matar só o filho direto deixaria netos segurando o pipe, e a leitura só
+    terminaria quando eles saíssem.
+    """
+    timed_out = threading.Event()
+    
+    with _process_slots, subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, start_new_session=True
+    ) as proc:
+        def _kill():
+            timed_out.set()
+            _kill_group(proc)
+        
+        timer = threading.Timer(timeout, _kill)
+        timer.start()
+        try:
+            yield from proc.stdout
+            returncode = proc.wait()
+        finally:
+            timer.cancel()
+            if proc.poll() is None:
+                # Saída antecipada (exceção, Ctrl+C ou gerador abandonado): em outra
+                # sessão o comando não recebe o SIGINT do terminal
+                _kill_group(proc)
+    
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if returncode not in ok_returncodes:
+        raise subprocess.CalledProcessError(returncode, cmd)
@@ -1,10 +1,89 @@
 """
 Módulo para análise de cache do DNF
 """
-import subprocess
 import os
+import re
+import shutil
+import stat
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Optional
+
+from . import log, warn
+
+_OCTAL_ESCAPE = re.compile(r'\\([0-7]{3})')
+
+
+def _iter_file_sizes(path: str) -> Iterator[int]:
+    """Percorre a árvore com os.fwalk, gerando o tamanho de cada arquivo regular
+    
+    O fwalk mantém um descritor aberto por diretório e o stat é feito relativo
+    a ele (fstatat), sem resolver o caminho completo a cada arquivo.
+    """
+    try:
+        for _, _, filenames, dirfd in os.fwalk(path):
+            for name in filenames:
+                try:
+                    st = os.stat(name, dir_fd=dirfd, follow_symlinks=False)
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    yield st.st_size
+    except OSError:
+        return
+
+
+def _mount_fstype(path: Path) -> Optional[str]:
+    """Tipo do filesystem montado exatamente em `path` (None se não for ponto de montagem)
+    
+    Só conta uma montagem da raiz do filesystem: bind mounts de um
+    subdiretório (campo root != "/") também não têm uso próprio.
+    """
+    mount_point = os.path.realpath(path)
+    fstype = None
+    
+    try:
+        with open("/proc/self/mountinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                fields, _, extra = line.partition(" - ")
+                fields = fields.split()
+                if len(fields) < 5:
+                    continue
+                # Espaços e afins vêm escapados em octal (\040)
+                target = _OCTAL_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), fields[4])
+                if target == mount_point and fields[3] == "/":
+                    # A última montagem no mesmo ponto é a visível
+                    fstype = extra.split()[0] if extra else None
+                elif target == mount_point:
+                    fstype = None
+    except OSError:
+        return None
+    
+    return fstype
+
+
+def _is_own_mount(path: Path) -> bool:
+    """Indica se o diretório é um filesystem próprio, cujo uso é só o do cache
+    
+    Subvolumes btrfs (padrão do Fedora) têm f_fsid próprio, mas o statvfs deles
+    reporta o uso do pool inteiro; por isso btrfs nunca usa o atalho.
+    """
+    fstype = _mount_fstype(path)
+    return fstype is not None and fstype != "btrfs"
+
+
+def _format_size(size_bytes: int) -> str:
+    """Formata tamanho no estilo do `du -h` (ex: 512K, 1.2G)"""
+    size = float(size_bytes)
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = "T"
+    
+    if unit == "B":
+        return f"{int(size)}"
+    return f"{size:.1f}{unit}" if size < 10 else f"{size:.0f}{unit}"
 
 
 def get_cache_size() -> Dict[str, Any]:
@@ -21,55 +100,29 @@ def get_cache_size() -> Dict[str, Any]:
         
         if cache_dir.exists():
             # Calcular tamanho total
-            total_size = 0
-            for dirpath, dirnames, filenames in os.walk(cache_dir):
-                for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    try:
-                        total_size += os.path.getsize(filepath)
-                    except:
-                        continue
+            if _is_own_mount(cache_dir):
+                # Ponto de montagem próprio: o uso do filesystem é o do cache
+                total_size = shutil.disk_usage(cache_dir).used
+            else:
+                total_size = sum(_iter_file_sizes(str(cache_dir)))
             
             cache_info["total_size_mb"] = round(total_size / (1024 * 1024), 2)
             cache_info["total_size_gb"] = round(total_size / (1024 * 1024 * 1024), 2)
+            cache_info["cache_size_human"] = _format_size(total_size)
     
     except Exception as e:
-        print(f"⚠️ Erro ao analisar cache: {e}")
+        warn(f"⚠️ Erro ao analisar cache: {e}")
     
     return cache_info
 
 
-def get_cache_info_dnf() -> Dict[str, Any]:
-    """Obtém informações de cache via DNF"""
-    info = {}
-    
-    try:
-        result = subprocess.run(
-            ['du', '-sh', '/var/cache/dnf'],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if result.returncode == 0:
-            size_str = result.stdout.split()[0]
-            info["cache_size_human"] = size_str
-    
-    except Exception as e:
-        pass
-    
-    return info
-
-
 def collect_cache_metrics(config: Dict[str, Any]) -> Dict[str, Any]:
     """Coleta métricas de cache"""
-    print("  💾 Analisando cache do DNF...")
+    log("  💾 Analisando cache do DNF...")
     
     cache_size = get_cache_size()
-    cache_info = get_cache_info_dnf()
     
     return {
         **cache_size,
-        **cache_info,
         "can_clean": cache_size["total_size_mb"] > 100  # Se > 100MB, sugerir limpeza
     }
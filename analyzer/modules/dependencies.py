@@ -1,16 +1,22 @@
 """
 Módulo para verificar dependências e problemas
 """
-import subprocess
+import re
 from typing import Dict, List, Any
 
+from . import _dnf, log, warn
+from ._sh import iter_lines, run, run_parallel
+
+# Linhas do `dnf check` que indicam problema
+_BROKEN_RE = re.compile(r'\b(missing|broken)\b', re.I)
+
 
 def check_broken_dependencies() -> List[Dict[str, Any]]:
     """Verifica dependências quebradas"""
     broken = []
     
     try:
-        result = subprocess.run(
+        result = run(
             ['dnf', 'check'],
             capture_output=True,
             text=True,
@@ -20,26 +26,38 @@ def check_broken_dependencies() -> List[Dict[str, Any]]:
         # Se há problemas, o dnf check retorna != 0
         if result.returncode != 0:
             for line in result.stdout.split('\n'):
-                if 'missing' in line.lower() or 'broken' in line.lower():
+                if _BROKEN_RE.search(line):
                     broken.append({"issue": line.strip()})
-        
-        # Verificar também via RPM
-        rpm_result = subprocess.run(
+    
+    except Exception as e:
+        warn(f"⚠️ Erro ao verificar dependências: {e}")
+    
+    return broken
+
+
+def verify_rpm_database() -> List[Dict[str, Any]]:
+    """Verifica dependências via RPM (rpm -Va sem checagem de arquivos)"""
+    issues = []
+    
+    try:
+        rpm_result = run(
             ['rpm', '-Va', '--nofiles', '--nodigest'],
             capture_output=True,
             text=True,
             timeout=120
         )
         
-        if rpm_result.stdout.strip():
-            for line in rpm_result.stdout.strip().split('\n')[:10]:  # Limitar a 10
-                if line.strip():
-                    broken.append({"rpm_issue": line.strip()})
+        for line in rpm_result.stdout.splitlines():
+            line = line.strip()
+            if line:
+                issues.append({"rpm_issue": line})
+                if len(issues) == 10:  # Limitar a 10
+                    break
     
     except Exception as e:
-        print(f"⚠️ Erro ao verificar dependências: {e}")
+        warn(f"⚠️ Erro ao verificar banco RPM: {e}")
     
-    return broken
+    return issues
 
 
 def get_duplicate_packages() -> List[Dict[str, Any]]:
@@ -47,20 +65,18 @@ def get_duplicate_packages() -> List[Dict[str, Any]]:
     duplicates = []
     
     try:
-        result = subprocess.run(
-            ['dnf', 'repoquery', '--duplicates'],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
+        if _dnf.available():
+            return [{"package": pkg["nevra"]} for pkg in _dnf.duplicates_query()]
         
-        if result.returncode == 0:
-            for line in result.stdout.strip().split('\n'):
-                if line.strip():
-                    duplicates.append({"package": line.strip()})
+        # Formato explícito: a saída padrão muda entre dnf4 e dnf5
+        cmd = ['dnf', 'repoquery', '--duplicates', '--qf', '%{name}-%{evr}.%{arch}\n']
+        for line in iter_lines(cmd, timeout=30):
+            package = line.strip()
+            if package:
+                duplicates.append({"package": package})
     
     except Exception as e:
-        print(f"⚠️ Erro ao detectar duplicados: {e}")
+        warn(f"⚠️ Erro ao detectar duplicados: {e}")
     
     return duplicates
 
@@ -70,7 +86,7 @@ def get_dependency_count(package: str) -> int:
     count = 0
     
     try:
-        result = subprocess.run(
+        result = run(
             ['dnf', 'repoquery', '--requires', package],
             capture_output=True,
             text=True,
@@ -78,7 +94,7 @@ def get_dependency_count(package: str) -> int:
         )
         
         if result.returncode == 0:
-            count = len([l for l in result.stdout.strip().split('\n') if l.strip()])
+            count = sum(1 for line in result.stdout.splitlines() if line.strip())
     
     except:
         pass
@@ -88,10 +104,23 @@ def get_dependency_count(package: str) -> int:
 
 def collect_dependency_metrics(config: Dict[str, Any]) -> Dict[str, Any]:
     """Coleta métricas de dependências"""
-    print("  🔗 Verificando dependências...")
+    log("  🔗 Verificando dependências...")
+    
+    # dnf check, rpm -Va e repoquery são independentes: rodar juntos
+    tasks = {
+        "check": check_broken_dependencies,
+        "duplicates": get_duplicate_packages,
+    }
+    
+    # rpm -Va percorre todos os headers instalados e costuma ser a etapa mais
+    # lenta da análise; o dnf check geralmente já aponta os mesmos problemas
+    if config.get("verify_rpm", False):
+        tasks["verify"] = verify_rpm_database
+    
+    results = run_parallel(tasks)
     
-    broken = check_broken_dependencies()
-    duplicates = get_duplicate_packages()
+    broken = results["check"] + results.get("verify", [])
+    duplicates = results["duplicates"]
     
     return {
         "broken_dependencies": len(broken),
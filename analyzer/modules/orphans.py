@@ -1,9 +1,11 @@
 """
 Módulo para detectar pacotes órfãos (sem dependências)
 """
-import subprocess
 from typing import Dict, List, Any
 
+from . import log, warn
+from .packages import iter_unneeded
+
 
 def get_orphaned_packages() -> List[Dict[str, Any]]:
     """Obtém lista de pacotes órfãos (folhas - leaf packages)"""
@@ -11,21 +13,10 @@ def get_orphaned_packages() -> List[Dict[str, Any]]:
     
     try:
         # Pacotes que não são dependências de nenhum outro
-        result = subprocess.run(
-            ['dnf', 'repoquery', '--unneeded'],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
-        
-        if result.returncode == 0:
-            for line in result.stdout.strip().split('\n'):
-                if line.strip():
-                    pkg_name = line.strip().rsplit('.', 1)[0]
-                    orphans.append({"name": pkg_name})
+        orphans = [{"name": pkg["name"]} for pkg in iter_unneeded()]
     
     except Exception as e:
-        print(f"⚠️ Erro ao detectar pacotes órfãos: {e}")
+        warn(f"⚠️ Erro ao detectar pacotes órfãos: {e}")
     
     return orphans
 
@@ -35,37 +26,21 @@ def get_autoremovable_packages() -> List[Dict[str, Any]]:
     autoremove = []
     
     try:
-        result = subprocess.run(
-            ['dnf', 'autoremove', '--assumeno'],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        # Parsear saída para encontrar pacotes que seriam removidos
-        in_remove_section = False
-        for line in result.stdout.split('\n'):
-            if 'Removing:' in line or 'Removing' in line:
-                in_remove_section = True
-                continue
-            
-            if in_remove_section:
-                if line.strip() and not line.startswith('Transaction'):
-                    parts = line.split()
-                    if len(parts) >= 1 and not parts[0] in ['Installing', 'Upgrading', 'Removing']:
-                        pkg_name = parts[0]
-                        autoremove.append({"name": pkg_name})
+        # O conjunto do `dnf autoremove` é exatamente o de `repoquery --unneeded`,
+        # sem inicializar o solver nem parsear o resumo da transação
+        autoremove = [{"name": pkg["name"]} for pkg in iter_unneeded()]
     
     except Exception as e:
-        print(f"⚠️ Erro ao verificar autoremove: {e}")
+        warn(f"⚠️ Erro ao verificar autoremove: {e}")
     
     return autoremove
 
 
 def collect_orphan_metrics(config: Dict[str, Any]) -> Dict[str, Any]:
     """Coleta métricas de pacotes órfãos"""
-    print("  🗑️  Detectando pacotes órfãos...")
+    log("  🗑️  Detectando pacotes órfãos...")
     
+    # Ambos leem a mesma consulta --unneeded (feita uma vez só)
     orphaned = get_orphaned_packages()
     autoremove = get_autoremovable_packages()
     
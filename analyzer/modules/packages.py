@@ -1,10 +1,198 @@
 """
 Módulo para listar e analisar pacotes instalados
 """
-import subprocess
+import functools
+import heapq
 import json
+import re
+import threading
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, FrozenSet, Iterator, List, Any, Optional
+
+from . import _dnf, log, warn
+from ._sh import iter_lines, run, run_parallel
+
+try:
+    import rpm
+except ImportError:
+    rpm = None
+
+# SUMMARY por último: é o único campo que pode conter "|"
+_RPMDB_QUERYFORMAT = '%{NAME}|%{SIZE}|%{VERSION}|%{INSTALLTIME}|%{URL}|%{SUMMARY}\n'
+
+# Campos lidos do `dnf info` (fallback para pacotes não instalados)
+_INFO_RE = re.compile(r'^(Size|Summary|URL)\s*:\s*(.+?)\s*$', re.M)
+_INFO_FIELDS = {"Summary": "description", "URL": "url"}
+_SIZE_RE = re.compile(r'([\d.]+)\s*([kmgKMG])?')
+_SIZE_UNITS = {None: 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+# Uma linha por pacote instalado, com tudo que os módulos precisam do dnf;
+# o "\n" explícito é exigido pelo dnf5 (o dnf4 gera linhas vazias, ignoradas)
+_REPO_INDEX_QUERYFORMAT = '%{name}|%{evr}|%{from_repo}\n'
+
+_repo_index: Optional[List[Dict[str, Any]]] = None
+_repo_index_lock = threading.Lock()
+
+_rpmdb_cache: Optional[List[Dict[str, Any]]] = None
+_rpmdb_index: Optional[Dict[str, Dict[str, Any]]] = None
+_rpmdb_lock = threading.RLock()
+
+
+def _iter_rpmdb() -> Iterator[Dict[str, Any]]:
+    """Percorre o banco RPM uma vez (librpm, ou `rpm -qa` se indisponível)"""
+    if rpm is not None:
+        ts = rpm.TransactionSet()
+        for h in ts.dbMatch():
+            yield {
+                "name": h[rpm.RPMTAG_NAME],
+                "version": h[rpm.RPMTAG_VERSION],
+                "size_bytes": h[rpm.RPMTAG_SIZE] or 0,
+                "install_time": h[rpm.RPMTAG_INSTALLTIME],
+                "summary": h[rpm.RPMTAG_SUMMARY] or "",
+                "url": h[rpm.RPMTAG_URL] or ""
+            }
+        return
+    
+    # Saída em bytes: só NAME/VERSION são decodificados aqui; SUMMARY/URL
+    # ficam crus até alguém realmente precisar deles (ver _decode)
+    result = run(
+        ['rpm', '-qa', '--queryformat', _RPMDB_QUERYFORMAT],
+        capture_output=True,
+        timeout=30
+    )
+    
+    if result.returncode != 0:
+        return
+    
+    for line in result.stdout.split(b'\n'):
+        parts = line.split(b'|', 5)
+        if len(parts) < 6:
+            continue
+        try:
+            yield {
+                "name": parts[0].decode('utf-8', 'replace'),
+                "version": parts[2].decode('utf-8', 'replace'),
+                "size_bytes": int(parts[1]),
+                "install_time": int(parts[3]),
+                "summary": parts[5],
+                "url": parts[4] if parts[4] != b'(none)' else b""
+            }
+        except ValueError:
+            continue
+
+
+def _decode(value: Any) -> str:
+    """Converte campos de texto do snapshot (str ou bytes crus) para str"""
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return value
+
+
+def _rpmdb_snapshot() -> List[Dict[str, Any]]:
+    """Retorna os headers do banco RPM, lidos uma única vez por execução"""
+    global _rpmdb_cache
+    
+    with _rpmdb_lock:
+        if _rpmdb_cache is None:
+            _rpmdb_cache = list(_iter_rpmdb())
+        return _rpmdb_cache
+
+
+def _rpmdb_by_name() -> Dict[str, Dict[str, Any]]:
+    """Índice nome -> header do snapshot do banco RPM"""
+    global _rpmdb_index
+    
+    with _rpmdb_lock:
+        if _rpmdb_index is None:
+            _rpmdb_index = {}
+            for pkg in _rpmdb_snapshot():
+                # Em pacotes installonly (kernel) fica a primeira versão
+                _rpmdb_index.setdefault(pkg["name"], pkg)
+        return _rpmdb_index
+
+
+def _iter_repo_index() -> Iterator[Dict[str, Any]]:
+    """Lê os pacotes instalados com repositório de origem e razão da instalação
+    
+    Nos dois caminhos (libdnf5 e CLI) a razão vem do conjunto `userinstalled`
+    do dnf, que também inclui pacotes de razão desconhecida: "user" para quem
+    está nele, "dependency" para o resto.
+    """
+    if _dnf.available():
+        user_installed = {pkg["name"] for pkg in _dnf.userinstalled_query()}
+        for pkg in _dnf.installed_query():
+            yield {
+                "name": pkg["name"],
+                "version": pkg["evr"],
+                "repository": f"@{pkg['from_repo_id']}" if pkg["from_repo_id"] else 'unknown',
+                "reason": "user" if pkg["name"] in user_installed else "dependency"
+            }
+        return
+    
+    # Índice e conjunto dos instalados pelo usuário são consultas independentes
+    results = run_parallel({
+        "installed": lambda: list(iter_lines(
+            ['dnf', 'repoquery', '--installed', '--qf', _REPO_INDEX_QUERYFORMAT], timeout=60
+        )),
+        "user": lambda: list(iter_lines(
+            ['dnf', 'repoquery', '--userinstalled', '--qf', '%{name}\n'], timeout=60
+        )),
+    })
+    user_installed = {line.strip() for line in results["user"]}
+    
+    for line in results["installed"]:
+        parts = line.rstrip('\n').split('|')
+        if len(parts) < 3:
+            continue
+        
+        yield {
+            "name": parts[0],
+            "version": parts[1],
+            "repository": f"@{parts[2]}" if parts[2] else 'unknown',
+            "reason": "user" if parts[0] in user_installed else "dependency"
+        }
+
+
+def build_repo_index() -> List[Dict[str, Any]]:
+    """Tabela dos pacotes instalados, montada com uma única consulta ao dnf
+
+    Os módulos derivam dela o que antes exigia um `dnf repoquery` cada
+    (instalados pelo usuário, órfãos...), carregando os metadados uma vez só.
+    """
+    global _repo_index
+    
+    with _repo_index_lock:
+        if _repo_index is None:
+            _repo_index = list(_iter_repo_index())
+        return _repo_index
+
+
+def iter_userinstalled() -> Iterator[Dict[str, Any]]:
+    """Pacotes do índice instalados explicitamente pelo usuário"""
+    return (pkg for pkg in build_repo_index() if pkg["reason"] == "user")
+
+
+@functools.lru_cache(maxsize=1)
+def _unneeded_names() -> FrozenSet[str]:
+    """Nomes dos pacotes que não são mais necessários (consultado uma vez)"""
+    if _dnf.available():
+        return frozenset(pkg["name"] for pkg in _dnf.unneeded_query())
+    
+    cmd = ['dnf', 'repoquery', '--unneeded', '--qf', '%{name}\n']
+    names = (line.strip() for line in iter_lines(cmd, timeout=60))
+    return frozenset(name for name in names if name)
+
+
+def iter_unneeded() -> Iterator[Dict[str, Any]]:
+    """Pacotes do índice que podem ser removidos (órfãos / autoremove)"""
+    unneeded = _unneeded_names()
+    return (pkg for pkg in build_repo_index() if pkg["name"] in unneeded)
+
+
+@functools.lru_cache(maxsize=1)
+def _userinstalled_names() -> FrozenSet[str]:
+    """Nomes dos pacotes instalados pelo usuário"""
+    return frozenset(pkg["name"] for pkg in iter_userinstalled())
 
 
 def get_all_packages() -> List[Dict[str, Any]]:
@@ -12,41 +200,32 @@ def get_all_packages() -> List[Dict[str, Any]]:
     packages = []
     
     try:
-        # Listar todos os pacotes instalados com informações detalhadas
-        result = subprocess.run(
-            ['dnf', 'list', 'installed'],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result.returncode == 0:
-            lines = result.stdout.strip().split('\n')
-            
-            # Pular cabeçalho
-            for line in lines[1:]:
-                if not line.strip() or line.startswith('Installed'):
-                    continue
-                
-                parts = line.split()
-                if len(parts) >= 3:
-                    pkg_name = parts[0].rsplit('.', 1)[0]  # Remover arquitetura
-                    version = parts[1]
-                    repo = parts[2] if len(parts) > 2 else 'unknown'
-                    
-                    packages.append({
-                        "name": pkg_name,
-                        "version": version,
-                        "repository": repo
-                    })
+        packages = [
+            {
+                "name": pkg["name"],
+                "version": pkg["version"],
+                "repository": pkg["repository"]
+            }
+            for pkg in build_repo_index()
+        ]
     except Exception as e:
-        print(f"⚠️ Erro ao listar pacotes: {e}")
+        warn(f"⚠️ Erro ao listar pacotes: {e}")
     
     return packages
 
 
 def get_package_details(package_name: str) -> Dict[str, Any]:
-    """Obtém detalhes específicos de um pacote"""
+    """Obtém detalhes específicos de um pacote (memoizado na execução)
+    
+    Devolve uma cópia do resultado em cache, para que alterações de quem
+    chamou não vazem para as próximas chamadas.
+    """
+    return dict(_package_details(package_name))
+
+
+@functools.lru_cache(maxsize=4096)
+def _package_details(package_name: str) -> Dict[str, Any]:
+    """Consulta os detalhes de um pacote (o dict fica no cache; não alterar)"""
     details = {
         "name": package_name,
         "size_bytes": 0,
@@ -57,65 +236,53 @@ def get_package_details(package_name: str) -> Dict[str, Any]:
     }
     
     try:
-        # Info do pacote
-        result = subprocess.run(
-            ['dnf', 'info', package_name],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
+        # Pacote instalado: tudo vem do snapshot do banco RPM, sem subprocess
+        installed = _rpmdb_by_name().get(package_name)
+        if installed:
+            details["size_bytes"] = installed["size_bytes"]
+            details["description"] = _decode(installed["summary"])
+            details["url"] = _decode(installed["url"])
+            
+            if installed["install_time"]:
+                # astimezone() resolve o offset da própria data (horário de verão incluso)
+                details["install_date"] = datetime.fromtimestamp(installed["install_time"]).astimezone().isoformat()
+            
+            # Razão da instalação (user ou dependency)
+            is_user = package_name in _userinstalled_names()
+            details["install_reason"] = "user" if is_user else "dependency"
+            
+            return details
         
-        if result.returncode == 0:
-            for line in result.stdout.split('\n'):
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip()
-                    value = value.strip()
+        # Pacote não instalado: info do repositório (fora do userinstalled,
+        # então conta como dependência)
+        details["install_reason"] = "dependency"
+        if _dnf.available():
+            info = _dnf.info_query(package_name)
+            if info:
+                details["size_bytes"] = info["install_size"]
+                details["description"] = info["summary"]
+                details["url"] = info["url"]
+        else:
+            result = run(
+                ['dnf', 'info', package_name],
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+            
+            if result.returncode == 0:
+                for match in _INFO_RE.finditer(result.stdout):
+                    key, value = match.groups()
                     
                     if key == 'Size':
                         # Converter para bytes
-                        size_str = value.lower()
-                        if 'k' in size_str:
-                            details["size_bytes"] = int(float(size_str.replace('k', '').strip()) * 1024)
-                        elif 'm' in size_str:
-                            details["size_bytes"] = int(float(size_str.replace('m', '').strip()) * 1024 * 1024)
-                        elif 'g' in size_str:
-                            details["size_bytes"] = int(float(size_str.replace('g', '').strip()) * 1024 * 1024 * 1024)
-                    
-                    elif key == 'Summary':
-                        details["description"] = value
-                    
-                    elif key == 'URL':
-                        details["url"] = value
-        
-        # Data de instalação via RPM
-        rpm_result = subprocess.run(
-            ['rpm', '-q', '--queryformat', '%{INSTALLTIME}', package_name],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        if rpm_result.returncode == 0 and rpm_result.stdout.strip():
-            try:
-                timestamp = int(rpm_result.stdout.strip())
-                details["install_date"] = datetime.fromtimestamp(timestamp).isoformat()
-            except:
-                pass
-        
-        # Razão da instalação (user ou dependency)
-        reason_result = subprocess.run(
-            ['dnf', 'repoquery', '--userinstalled', package_name],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        
-        if reason_result.returncode == 0 and reason_result.stdout.strip():
-            details["install_reason"] = "user"
-        else:
-            details["install_reason"] = "dependency"
-        
+                        size = _SIZE_RE.match(value)
+                        if size:
+                            number, unit = size.groups()
+                            details["size_bytes"] = int(float(number) * _SIZE_UNITS[unit and unit.lower()])
+                    else:
+                        details[_INFO_FIELDS[key]] = value
+    
     except Exception as e:
         pass
     
@@ -123,37 +290,19 @@ def get_package_details(package_name: str) -> Dict[str, Any]:
 
 
 def get_packages_by_size() -> List[Dict[str, Any]]:
-    """Obtém pacotes ordenados por tamanho"""
+    """Obtém pacotes com seus tamanhos (sem ordenar; quem usa seleciona o top-N)"""
     packages = []
     
     try:
-        result = subprocess.run(
-            ['rpm', '-qa', '--queryformat', '%{NAME}|%{SIZE}|%{VERSION}\n'],
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-        
-        if result.returncode == 0:
-            for line in result.stdout.strip().split('\n'):
-                if '|' in line:
-                    parts = line.split('|')
-                    if len(parts) >= 3:
-                        try:
-                            packages.append({
-                                "name": parts[0],
-                                "size_bytes": int(parts[1]),
-                                "size_mb": round(int(parts[1]) / (1024 * 1024), 2),
-                                "version": parts[2]
-                            })
-                        except:
-                            continue
-            
-            # Ordenar por tamanho (maior primeiro)
-            packages.sort(key=lambda x: x['size_bytes'], reverse=True)
+        for pkg in _rpmdb_snapshot():
+            packages.append({
+                "name": pkg["name"],
+                "size_bytes": pkg["size_bytes"],
+                "version": pkg["version"]
+            })
     
     except Exception as e:
-        print(f"⚠️ Erro ao listar pacotes por tamanho: {e}")
+        warn(f"⚠️ Erro ao listar pacotes por tamanho: {e}")
     
     return packages
 
@@ -167,48 +316,40 @@ def get_package_count() -> Dict[str, int]:
     }
     
     try:
-        # Total de pacotes
-        total_result = subprocess.run(
-            ['rpm', '-qa'],
-            capture_output=True,
-            text=True,
-            timeout=20
-        )
-        
-        if total_result.returncode == 0:
-            count["total"] = len(total_result.stdout.strip().split('\n'))
-        
-        # Pacotes instalados pelo usuário
-        user_result = subprocess.run(
-            ['dnf', 'repoquery', '--userinstalled'],
-            capture_output=True,
-            text=True,
-            timeout=20
-        )
-        
-        if user_result.returncode == 0:
-            count["user_installed"] = len([l for l in user_result.stdout.strip().split('\n') if l.strip()])
-        
+        # Total de pacotes e pacotes instalados pelo usuário
+        count["total"] = len(_rpmdb_snapshot())
+        count["user_installed"] = sum(1 for _ in iter_userinstalled())
         count["dependencies"] = count["total"] - count["user_installed"]
     
     except Exception as e:
-        print(f"⚠️ Erro ao contar pacotes: {e}")
+        warn(f"⚠️ Erro ao contar pacotes: {e}")
     
     return count
 
 
 def collect_package_metrics(config: Dict[str, Any]) -> Dict[str, Any]:
     """Coleta todas as métricas de pacotes"""
-    print("  📦 Coletando lista de pacotes...")
+    log("  📦 Coletando lista de pacotes...")
     
-    # Contagem
+    # Sem threads: os dois só percorrem o snapshot do banco RPM e o índice do
+    # dnf, carregados uma única vez (as consultas em subprocess ficam lá)
     counts = get_package_count()
+    all_packages = get_packages_by_size()
     
-    # Top pacotes por tamanho (limitar a 50)
-    packages_by_size = get_packages_by_size()[:50]
+    # Top 100 por tamanho (maior primeiro) sem ordenar a lista inteira;
+    # size_mb só para os selecionados
+    packages_by_size = [
+        {
+            "name": pkg["name"],
+            "size_bytes": pkg["size_bytes"],
+            "size_mb": round(pkg["size_bytes"] / (1024 * 1024), 2),
+            "version": pkg["version"]
+        }
+        for pkg in heapq.nlargest(100, all_packages, key=lambda p: p['size_bytes'])
+    ]
     
     # Tamanho total
-    total_size_bytes = sum(p['size_bytes'] for p in packages_by_size)
+    total_size_bytes = sum(p['size_bytes'] for p in all_packages)
     
     return {
         "summary": {
@@ -217,6 +358,6 @@ def collect_package_metrics(config: Dict[str, Any]) -> Dict[str, Any]:
             "dependencies": counts["dependencies"],
             "total_size_gb": round(total_size_bytes / (1024**3), 2)
         },
-        "largest_packages": packages_by_size[:20],  # Top 20
-        "all_packages_sample": packages_by_size[:100]  # Amostra de 100
+        # Top 100, maior primeiro (os N maiores são um prefixo desta lista)
+        "all_packages_sample": packages_by_size
     }
@@ -1,44 +1,49 @@
 """
 Módulo para verificar atualizações disponíveis
 """
-import subprocess
+import re
 from typing import Dict, List, Any
 
+from . import _dnf, log, warn
+from ._sh import iter_lines, run, run_parallel
+
+# Linhas de advisory no `dnf updateinfo list security`
+_SEC_RE = re.compile(r'FEDORA|(?i:security)')
+
 
 def get_updates_available() -> List[Dict[str, Any]]:
     """Obtém lista de atualizações disponíveis"""
     updates = []
     
     try:
-        result = subprocess.run(
-            ['dnf', 'check-update', '--quiet'],
-            capture_output=True,
-            text=True,
-            timeout=60
-        )
+        if _dnf.available():
+            return [
+                {
+                    "package": pkg["name"],
+                    "new_version": pkg["evr"],
+                    "repository": pkg["repo_id"]
+                }
+                for pkg in _dnf.upgrades_query()
+            ]
+        
+        # Só os campos usados, já separados: sem cabeçalhos ("Last metadata...",
+        # "Security:") para pular nem arquitetura para remover do nome
+        cmd = [
+            'dnf', 'repoquery', '--upgrades', '--latest-limit', '1',
+            '--qf', '%{name}|%{evr}|%{repoid}\n'
+        ]
         
-        # check-update retorna código 100 quando há atualizações
-        if result.returncode in [0, 100]:
-            lines = result.stdout.strip().split('\n')
-            
-            for line in lines:
-                if not line.strip() or line.startswith('Last') or line.startswith('Security'):
-                    continue
-                
-                parts = line.split()
-                if len(parts) >= 3:
-                    pkg_name = parts[0].rsplit('.', 1)[0]
-                    new_version = parts[1]
-                    repo = parts[2]
-                    
-                    updates.append({
-                        "package": pkg_name,
-                        "new_version": new_version,
-                        "repository": repo
-                    })
+        for line in iter_lines(cmd, timeout=60):
+            parts = line.rstrip('\n').split('|')
+            if len(parts) >= 3:
+                updates.append({
+                    "package": parts[0],
+                    "new_version": parts[1],
+                    "repository": parts[2]
+                })
     
     except Exception as e:
-        print(f"⚠️ Erro ao verificar atualizações: {e}")
+        warn(f"⚠️ Erro ao verificar atualizações: {e}")
     
     return updates
 
@@ -48,7 +53,17 @@ def get_security_updates() -> List[Dict[str, Any]]:
     security_updates = []
     
     try:
-        result = subprocess.run(
+        if _dnf.available():
+            return [
+                {
+                    "advisory": adv["name"],
+                    "type": "security",
+                    "severity": adv["severity"]
+                }
+                for adv in _dnf.security_advisories()
+            ]
+        
+        result = run(
             ['dnf', 'updateinfo', 'list', 'security', '--available'],
             capture_output=True,
             text=True,
@@ -57,7 +72,7 @@ def get_security_updates() -> List[Dict[str, Any]]:
         
         if result.returncode == 0:
             for line in result.stdout.strip().split('\n'):
-                if 'FEDORA' in line or 'security' in line.lower():
+                if _SEC_RE.search(line):
                     parts = line.split()
                     if len(parts) >= 2:
                         security_updates.append({
@@ -67,15 +82,19 @@ def get_security_updates() -> List[Dict[str, Any]]:
                         })
     
     except Exception as e:
-        print(f"⚠️ Erro ao verificar updates de segurança: {e}")
+        warn(f"⚠️ Erro ao verificar updates de segurança: {e}")
     
     return security_updates
 
 
 def get_update_summary() -> Dict[str, Any]:
     """Obtém resumo de atualizações"""
-    updates = get_updates_available()
-    security = get_security_updates()
+    results = run_parallel({
+        "updates": get_updates_available,
+        "security": get_security_updates,
+    })
+    updates = results["updates"]
+    security = results["security"]
     
     return {
         "total_updates": len(updates),
@@ -87,5 +106,5 @@ def get_update_summary() -> Dict[str, Any]:
 
 def collect_update_metrics(config: Dict[str, Any]) -> Dict[str, Any]:
     """Coleta todas as métricas de atualizações"""
-    print("  🔄 Verificando atualizações disponíveis...")
+    log("  🔄 Verificando atualizações disponíveis...")
     return get_update_summary()
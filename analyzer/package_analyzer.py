@@ -10,13 +10,20 @@ import json
 import os
 import sys
 import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Adicionar módulos ao path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from modules import packages, updates, orphans, cache, dependencies
+from modules import packages, updates, orphans, cache, dependencies, log, set_quiet, warn
 
 
 def load_config(config_path: str = "config.json") -> dict:
@@ -39,47 +46,36 @@ def load_config(config_path: str = "config.json") -> dict:
 
 
 def collect_all_metrics(config: dict) -> dict:
-    """Coleta todas as métricas de pacotes"""
-    print("📊 Coletando informações de pacotes...")
-    
-    metrics = {}
-    
-    # Coletar métricas de pacotes
-    try:
-        metrics["packages"] = packages.collect_package_metrics(config)
-    except Exception as e:
-        print(f"    ⚠️  Erro: {e}")
-        metrics["packages"] = {"error": str(e)}
-    
-    # Coletar métricas de atualizações
-    try:
-        metrics["updates"] = updates.collect_update_metrics(config)
-    except Exception as e:
-        print(f"    ⚠️  Erro: {e}")
-        metrics["updates"] = {"error": str(e)}
+    """Coleta todas as métricas de pacotes (coletores rodam em paralelo)"""
+    log("📊 Coletando informações de pacotes...")
     
-    # Coletar métricas de órfãos
-    try:
-        metrics["orphans"] = orphans.collect_orphan_metrics(config)
-    except Exception as e:
-        print(f"    ⚠️  Erro: {e}")
-        metrics["orphans"] = {"error": str(e)}
+    # Coletores em threads (ver _sh.run_parallel)
+    collectors = {
+        "packages": packages.collect_package_metrics,
+        "updates": updates.collect_update_metrics,
+        "orphans": orphans.collect_orphan_metrics,
+        "cache": cache.collect_cache_metrics,
+        "dependencies": dependencies.collect_dependency_metrics,
+    }
     
-    # Coletar métricas de cache
-    try:
-        metrics["cache"] = cache.collect_cache_metrics(config)
-    except Exception as e:
-        print(f"    ⚠️  Erro: {e}")
-        metrics["cache"] = {"error": str(e)}
+    metrics = {}
     
-    # Coletar métricas de dependências
-    try:
-        metrics["dependencies"] = dependencies.collect_dependency_metrics(config)
-    except Exception as e:
-        print(f"    ⚠️  Erro: {e}")
-        metrics["dependencies"] = {"error": str(e)}
+    with ThreadPoolExecutor(max_workers=len(collectors)) as executor:
+        futures = {
+            executor.submit(collector, config): name
+            for name, collector in collectors.items()
+        }
+        
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                metrics[name] = future.result()
+            except Exception as e:
+                warn(f"    ⚠️  Erro: {e}")
+                metrics[name] = {"error": str(e)}
     
-    return metrics
+    # Manter a ordem original das seções no JSON
+    return {name: metrics[name] for name in collectors}
 
 
 def generate_report(config: dict) -> dict:
@@ -89,43 +85,55 @@ def generate_report(config: dict) -> dict:
     # Coletar métricas
     metrics = collect_all_metrics(config)
     
+    # Seções usadas nos alertas (uma seção com erro vira dict sem os campos)
+    packages_m = metrics.get("packages") or {}
+    updates_m = metrics.get("updates") or {}
+    orphans_m = metrics.get("orphans") or {}
+    cache_m = metrics.get("cache") or {}
+    deps_m = metrics.get("dependencies") or {}
+    
+    total_updates = updates_m.get("total_updates", 0)
+    security_updates = updates_m.get("security_updates", 0)
+    orphaned_count = orphans_m.get("orphaned_count", 0)
+    cache_size_mb = cache_m.get("total_size_mb", 0)
+    
     # Gerar alertas/problemas
     issues = []
     
     # Verificar atualizações pendentes
-    if metrics.get("updates", {}).get("total_updates", 0) > 0:
+    if total_updates > 0:
         issues.append({
             "type": "updates",
             "severity": "info",
-            "message": f"{metrics['updates']['total_updates']} atualizações disponíveis"
+            "message": f"{total_updates} atualizações disponíveis"
         })
     
     # Verificar atualizações de segurança
-    if metrics.get("updates", {}).get("security_updates", 0) > 0:
+    if security_updates > 0:
         issues.append({
             "type": "security",
             "severity": "warning",
-            "message": f"{metrics['updates']['security_updates']} atualizações de segurança disponíveis"
+            "message": f"{security_updates} atualizações de segurança disponíveis"
         })
     
     # Verificar órfãos
-    if metrics.get("orphans", {}).get("orphaned_count", 0) > 10:
+    if orphaned_count > 10:
         issues.append({
             "type": "orphans",
             "severity": "info",
-            "message": f"{metrics['orphans']['orphaned_count']} pacotes órfãos detectados"
+            "message": f"{orphaned_count} pacotes órfãos detectados"
         })
     
     # Verificar cache grande
-    if metrics.get("cache", {}).get("can_clean", False):
+    if cache_m.get("can_clean", False):
         issues.append({
             "type": "cache",
             "severity": "info",
-            "message": f"Cache do DNF ocupando {metrics['cache']['total_size_mb']}MB"
+            "message": f"Cache do DNF ocupando {cache_size_mb}MB"
         })
     
     # Verificar dependências quebradas
-    if metrics.get("dependencies", {}).get("has_issues", False):
+    if deps_m.get("has_issues", False):
         issues.append({
             "type": "dependencies",
             "severity": "warning",
@@ -139,10 +147,10 @@ def generate_report(config: dict) -> dict:
         "metrics": metrics,
         "issues": issues,
         "summary": {
-            "total_packages": metrics.get("packages", {}).get("summary", {}).get("total_packages", 0),
-            "total_updates": metrics.get("updates", {}).get("total_updates", 0),
+            "total_packages": (packages_m.get("summary") or {}).get("total_packages", 0),
+            "total_updates": total_updates,
             "total_issues": len(issues),
-            "cache_size_mb": metrics.get("cache", {}).get("total_size_mb", 0)
+            "cache_size_mb": cache_size_mb
         }
     }
     
@@ -156,14 +164,18 @@ def save_report(report: dict, config: dict) -> str:
     # Criar diretório se não existir
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # Nome do arquivo com timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Nome do arquivo com o mesmo timestamp do cabeçalho do relatório
+    timestamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(report["timestamp_unix"]))
     filename = f"packages_{timestamp}.json"
     filepath = output_dir / filename
     
-    # Salvar JSON
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(report, f, indent=2, ensure_ascii=False)
+    # Salvar JSON (orjson serializa direto para bytes UTF-8, bem mais rápido)
+    if orjson is not None:
+        with open(filepath, 'wb') as f:
+            f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
     
     return str(filepath)
 
@@ -209,14 +221,20 @@ def main():
     
     args = parser.parse_args()
     
-    print("📦 Package Analyzer - Iniciando análise...")
-    if args.session:
-        print(f"   🔗 Modo sessão: {args.session}")
-    print()
-    
     # Carregar configuração
     config = load_config()
     
+    # Em modo sessão a saída vai para o log do orchestrator: silencioso por padrão
+    if args.session:
+        config.setdefault("quiet", True)
+    quiet = config.get("quiet", False)
+    set_quiet(quiet)
+    
+    log("📦 Package Analyzer - Iniciando análise...")
+    if args.session:
+        log(f"   🔗 Modo sessão: {args.session}")
+    log()
+    
     try:
         # Gerar relatório
         report = generate_report(config)
@@ -226,7 +244,7 @@ def main():
             report['session_id'] = args.session
         
         # Salvar relatório
-        print("\n💾 Salvando relatório...")
+        log("\n💾 Salvando relatório...")
         filepath = save_report(report, config)
         print(f"✅ Relatório salvo em: {filepath}")
         
@@ -244,10 +262,11 @@ def main():
                 print(f"   ⚠️  Erro ao gravar no banco: {e}")
         
         # Imprimir resumo
-        print_summary(report)
+        if not quiet:
+            print_summary(report)
         
         sys.exit(0)
-        
+    
     except KeyboardInterrupt:
         print("\n\n⚠️  Análise interrompida pelo usuário")
         sys.exit(130)
@@ -6,46 +6,376 @@ AI Package Reporter - Gerador de Relatórios de Pacotes usando Gemini
 Analisa JSONs do package_analyzer e gera relatórios HTML humanizados
 """
 
+import argparse
+import asyncio
+import bisect
 import os
+import re
+import subprocess
 import sys
 import json
-import glob
+import functools
+import hashlib
+import heapq
+import time
+import zlib
 from pathlib import Path
 from datetime import datetime
+from html import escape
+from typing import List, Optional
 from google import genai
 from google.genai import types
+from pydantic import BaseModel
 
-# Verificar API key
-api_key = os.getenv('GEMINI_API_KEY')
-if not api_key:
-    print("❌ ERRO: Variável GEMINI_API_KEY não encontrada!")
-    print("Configure com: export GEMINI_API_KEY='sua_chave_aqui'")
-    sys.exit(1)
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-# Configurar cliente
-client = genai.Client(api_key=api_key)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Cliente do Gemini, criado na primeira chamada (ver obter_cliente)
+_client = None
 model = "gemini-2.5-flash"
+GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "top_p": 0.95,
+    "max_output_tokens": 8192
+}
+# Incrementar sempre que o prompt mudar, para invalidar o cache de respostas
+PROMPT_VERSION = 3
 
 # Caminhos
 REPORTS_DIR = Path("/home/montezuma/.bin/data/scripts-data/reports/packages/raw")
 OUTPUT_DIR = Path("/home/montezuma/.bin/data/scripts-data/reports/packages/html")
+CACHE_DIR = OUTPUT_DIR.parent / "cache"
+
+# Backfill (--ultimos N): "flex" usa a Batch API (mais barata, assíncrona);
+# qualquer outro valor faz as chamadas normais
+REPORTER_TIER = os.getenv("REPORTER_TIER", "flex")
+BATCH_POLL_SECONDS = 60
+# Consultas seguidas ao lote que podem falhar antes de cancelá-lo
+BATCH_MAX_POLL_ERRORS = 5
+# Chamadas simultâneas ao Gemini no backfill fora da Batch API
+MAX_CONCURRENT_REQUESTS = 4
+_ESTADOS_FINAIS_BATCH = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED"
+}
+
+# Placeholders do template HTML ({{NOME}})
+_PAT = re.compile(r"\{\{(\w+)\}\}")
+
+# Similaridade mínima (cosseno entre os nomes dos maiores pacotes) para
+# reaproveitar a análise de um snapshot parecido. Medido com 1024 buckets:
+# 1 nome trocado em 20 dá 0.944 a 1.0; 2 trocados, 0.889 a 0.95
+SEMANTIC_THRESHOLD = float(os.getenv('REPORTER_SEMANTIC_THRESHOLD', '0.94'))
+# Diferença relativa máxima em pacotes, espaço ocupado e cache, que a
+# análise cita em números
+MAGNITUDE_TOLERANCE = 0.02
+# Buckets do one-hot dos nomes dos maiores pacotes (poucas colisões entre 20 nomes)
+NAME_BUCKETS = 1024
+TOP_PACKAGES = 20
+# Faixas do total de atualizações (até 0, 5, 20, 50, 100 e acima)
+UPDATE_BUCKETS = (0, 5, 20, 50, 100)
+
+# Tamanho das amostras de listas enviadas no prompt
+TOP_PACKAGES_PROMPT = 10
+SAMPLE_SIZE_PROMPT = 20
+
+
+def obter_cliente():
+    """Cliente do Gemini, criado na primeira chamada
+    
+    A chave só é exigida quando a API é de fato usada, para que opções como
+    `--hash-prompt` funcionem sem GEMINI_API_KEY.
+    """
+    global _client
+    if _client is None:
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            print("❌ ERRO: Variável GEMINI_API_KEY não encontrada!")
+            print("Configure com: export GEMINI_API_KEY='sua_chave_aqui'")
+            sys.exit(1)
+        
+        _client = genai.Client(api_key=api_key)
+    return _client
+
+
+class LLMCache:
+    """Cache em disco das análises do Gemini, indexado pelo hash da entrada
+    
+    Regerar o relatório de um mesmo JSON (ou de um JSON idêntico) reaproveita
+    a análise anterior em vez de pagar outra chamada à API.
+    """
+    
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.hits = 0
+        self.misses = 0
+    
+    def cache_key(self, dados_json):
+        """SHA256 dos dados enviados ao modelo + modelo + configuração de geração
+        
+        Usa a mesma visão resumida do prompt: snapshots que só diferem em
+        campos que a IA não vê (ex.: timestamp) têm a mesma análise.
+        """
+        chave = json.dumps({
+            "model": model,
+            "generation_config": GENERATION_CONFIG,
+            "prompt_version": PROMPT_VERSION,
+            "data": resumir_dados(dados_json)
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(chave.encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        """Retorna a análise salva para a chave, ou None"""
+        try:
+            with open(self.cache_dir / f"{key}.json", 'r', encoding='utf-8') as f:
+                analise = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        return analise
+    
+    def set(self, key, analise_json):
+        """Salva a análise de forma atômica (arquivo temporário + rename)"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            destino = self.cache_dir / f"{key}.json"
+            tmp = destino.with_name(f"{destino.name}.{os.getpid()}.tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(analise_json, f, ensure_ascii=False)
+            os.replace(tmp, destino)
+        except OSError as e:
+            print(f"⚠️ Erro ao salvar cache: {e}")
+
+
+def chave_decisiva(dados_json):
+    """Contadores que mudam as recomendações; precisam ser iguais para reaproveitar
+    
+    Atualizações de segurança, problemas (quantidade e tipos), existência de
+    órfãos, dependências quebradas/duplicadas e a sugestão de limpar o cache
+    entram exatos. O total de
+    atualizações entra por faixa (UPDATE_BUCKETS), já que 23 ou 25 pendentes
+    levam à mesma análise, mas 1 ou 45 não.
+    """
+    summary = dados_json.get('summary', {})
+    metrics = dados_json.get('metrics') or {}
+    updates_m = metrics.get('updates') or {}
+    orphans_m = metrics.get('orphans') or {}
+    deps_m = metrics.get('dependencies') or {}
+    cache_m = metrics.get('cache') or {}
+    
+    return json.dumps({
+        "security_updates": updates_m.get('security_updates', 0),
+        "total_issues": summary.get('total_issues', 0),
+        "issue_types": sorted(str(i.get('type')) for i in dados_json.get('issues', [])),
+        "has_orphans": bool(orphans_m.get('orphaned_count', 0)),
+        "broken_dependencies": deps_m.get('broken_dependencies', 0),
+        "duplicate_packages": deps_m.get('duplicate_packages', 0),
+        "can_clean": bool(cache_m.get('can_clean', False)),
+        "updates_bucket": bisect.bisect_left(UPDATE_BUCKETS, summary.get('total_updates', 0) or 0)
+    }, sort_keys=True)
+
+
+def grandezas(dados_json):
+    """Total de pacotes, espaço ocupado (GB) e cache (MB) citados na análise"""
+    summary = dados_json.get('summary', {})
+    packages_s = ((dados_json.get('metrics') or {}).get('packages') or {}).get('summary') or {}
+    return [
+        float(summary.get('total_packages', 0) or 0),
+        float(packages_s.get('total_size_gb', 0) or 0),
+        float(summary.get('cache_size_mb', 0) or 0)
+    ]
+
+
+def vetor_features(dados_json):
+    """Vetor de características do snapshot (sem modelo de embedding)
+    
+    One-hot (via crc32, estável entre execuções) dos nomes dos maiores
+    pacotes; o cosseno entre dois vetores é a fração de nomes em comum.
+    Contadores e grandezas ficam de fora, pois dominariam o cosseno: eles são
+    comparados antes, via `chave_decisiva` e `grandezas`.
+    """
+    nomes = [0.0] * NAME_BUCKETS
+    pacotes = ((dados_json.get('metrics') or {}).get('packages') or {}).get('all_packages_sample') or []
+    for pkg in pacotes[:TOP_PACKAGES]:
+        nomes[zlib.crc32(pkg.get('name', '').encode('utf-8')) % NAME_BUCKETS] = 1.0
+    
+    return nomes
+
+
+class SemanticCache:
+    """Reaproveita a análise de um snapshot quase idêntico (similaridade de cosseno)
+    
+    Só entram na comparação análises com a mesma `chave_decisiva` e com
+    `grandezas` a no máximo MAGNITUDE_TOLERANCE de diferença relativa. O
+    índice fica em `index.npy` (vetores normalizados, um por linha) e
+    `index.jsonl` (chave do LLMCache, versão do prompt, chave decisiva e
+    grandezas de cada linha). Sem
+    numpy o cache semântico fica desativado e só o cache exato é usado.
+    """
+    
+    def __init__(self, cache_dir, threshold=SEMANTIC_THRESHOLD):
+        self.cache_dir = Path(cache_dir)
+        self.threshold = threshold
+        self.vetores_path = self.cache_dir / "index.npy"
+        self.entradas_path = self.cache_dir / "index.jsonl"
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _versao():
+        return f"{model}:{PROMPT_VERSION}"
+    
+    def _carregar_indice(self):
+        """Lê vetores e entradas; em caso de divergência, usa as linhas em comum"""
+        try:
+            vetores = np.load(self.vetores_path)
+            with open(self.entradas_path, 'r', encoding='utf-8') as f:
+                entradas = [json.loads(linha) for linha in f if linha.strip()]
+        except (OSError, ValueError):
+            return np.zeros((0, 0)), []
+        
+        linhas = min(len(vetores), len(entradas))
+        return vetores[:linhas], entradas[:linhas]
+    
+    @staticmethod
+    def _grandezas_proximas(salvas, atuais):
+        """Cada grandeza dentro de MAGNITUDE_TOLERANCE (relativa) da atual"""
+        if not salvas or len(salvas) != len(atuais):
+            return False
+        salvas = np.asarray(salvas, dtype=np.float64)
+        limite = MAGNITUDE_TOLERANCE * np.maximum(np.abs(salvas), np.abs(atuais))
+        return bool(np.all(np.abs(salvas - atuais) <= limite))
+    
+    def get(self, dados_json):
+        """Retorna a análise mais parecida acima do limiar, ou None"""
+        if np is None:
+            return None
+        
+        vetores, entradas = self._carregar_indice()
+        v = np.asarray(vetor_features(dados_json), dtype=np.float64)
+        norma = np.linalg.norm(v)
+        
+        if len(entradas) and norma and vetores.shape[1] == len(v):
+            similaridades = vetores @ (v / norma)
+            versao = self._versao()
+            decisiva = chave_decisiva(dados_json)
+            atuais = np.asarray(grandezas(dados_json))
+            compativeis = np.array([
+                e.get('versao') == versao and e.get('decisiva') == decisiva
+                and self._grandezas_proximas(e.get('grandezas'), atuais)
+                for e in entradas
+            ])
+            similaridades[~compativeis] = -1.0
+            
+            melhor = int(np.argmax(similaridades))
+            if similaridades[melhor] >= self.threshold:
+                try:
+                    arquivo = self.cache_dir / f"{entradas[melhor]['key']}.json"
+                    with open(arquivo, 'r', encoding='utf-8') as f:
+                        analise = json.load(f)
+                    self.hits += 1
+                    print(f"   Similaridade com análise anterior: {similaridades[melhor]:.3f}")
+                    return analise
+                except (OSError, ValueError, KeyError):
+                    pass
+        
+        self.misses += 1
+        return None
+    
+    def set(self, dados_json, key):
+        """Acrescenta o snapshot ao índice, apontando para a análise salva no LLMCache"""
+        if np is None:
+            return
+        
+        v = np.asarray(vetor_features(dados_json), dtype=np.float64)
+        norma = np.linalg.norm(v)
+        if not norma:
+            return
+        
+        try:
+            vetores, entradas = self._carregar_indice()
+            if len(entradas) and vetores.shape[1] != len(v):
+                # Formato do vetor mudou: recomeçar o índice
+                vetores, entradas = vetores[:0], []
+            
+            vetores = np.vstack([vetores.reshape(-1, len(v)), v / norma])
+            entradas.append({
+                "key": key,
+                "versao": self._versao(),
+                "decisiva": chave_decisiva(dados_json),
+                "grandezas": grandezas(dados_json)
+            })
+            
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            pid = os.getpid()
+            
+            tmp_entradas = self.entradas_path.with_name(f"index.jsonl.{pid}.tmp")
+            with open(tmp_entradas, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(e) + "\n" for e in entradas)
+            
+            tmp_vetores = self.vetores_path.with_name(f"index.{pid}.tmp.npy")
+            np.save(tmp_vetores, vetores)
+            
+            os.replace(tmp_entradas, self.entradas_path)
+            os.replace(tmp_vetores, self.vetores_path)
+        except OSError as e:
+            print(f"⚠️ Erro ao atualizar índice semântico: {e}")
+
+
+def _iter_relatorios():
+    """Gera (ctime em ns, caminho) de cada packages_*.json de REPORTS_DIR
+    
+    Uma só passada: o nome vem da listagem e o stat de cada entrada é feito uma vez.
+    """
+    try:
+        with os.scandir(REPORTS_DIR) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith("packages_") and name.endswith(".json") and entry.is_file():
+                    yield entry.stat().st_ctime_ns, entry.path
+    except OSError:
+        return
 
 
 def obter_ultimo_json():
     """Obtém o arquivo JSON mais recente"""
-    json_files = glob.glob(str(REPORTS_DIR / "packages_*.json"))
+    latest = max(_iter_relatorios(), default=None)
     
-    if not json_files:
+    if latest is None:
         print(f"❌ Nenhum relatório encontrado em {REPORTS_DIR}")
         return None
     
-    latest_file = max(json_files, key=os.path.getctime)
-    return Path(latest_file)
+    return Path(latest[1])
+
+
+def obter_ultimos_jsons(quantidade):
+    """Obtém os `quantidade` JSONs mais recentes, do mais antigo para o mais novo"""
+    latest = heapq.nlargest(quantidade, _iter_relatorios())
+    
+    if not latest:
+        print(f"❌ Nenhum relatório encontrado em {REPORTS_DIR}")
+    
+    return [Path(path) for _, path in reversed(latest)]
 
 
 def ler_json(filepath):
-    """Lê arquivo JSON"""
+    """Lê arquivo JSON (orjson quando disponível)"""
     try:
+        if orjson is not None:
+            with open(filepath, 'rb') as f:
+                return orjson.loads(f.read())
+        
         with open(filepath, 'r', encoding='utf-8') as f:
             return json.load(f)
     except Exception as e:
@@ -53,32 +383,26 @@ def ler_json(filepath):
         return None
 
 
-def criar_prompt_analise(dados_json):
-    """Cria prompt para IA analisar pacotes"""
-    
-    prompt = f"""Você é um especialista em gerenciamento de sistemas Linux Fedora com foco em pacotes DNF/RPM.
+# Instruções fixas vêm primeiro e os dados por último: o prefixo idêntico entre
+# execuções é o que permite ao Gemini reaproveitar o cache de contexto
+STATIC_INSTRUCTIONS = """Você é um especialista em gerenciamento de sistemas Linux Fedora com foco em pacotes DNF/RPM.
 
-Analise este relatório de pacotes e crie uma análise INTERPRETATIVA e HUMANIZADA em formato JSON.
-
-DADOS DO SISTEMA:
-```json
-{json.dumps(dados_json, indent=2, ensure_ascii=False)}
-```
+Analise o relatório de pacotes enviado ao final (em DADOS DO SISTEMA) e crie uma análise INTERPRETATIVA e HUMANIZADA em formato JSON.
 
 Retorne um JSON estruturado para preencher um template HTML.
 
 ESTRUTURA DO JSON:
 
-{{
+{
     "resumo_executivo": "2-3 parágrafos explicando o estado geral dos pacotes. Quantos pacotes? Sistema limpo ou bagunçado? Atualizações pendentes? Use linguagem clara.",
     
     "metricas_cards": [
-        {{
+        {
             "icon": "emoji",
             "label": "Nome da métrica",
             "value": "Valor",
             "subtext": "Texto complementar"
-        }}
+        }
     ],
     
     "analise_pacotes": "Análise INTERPRETADA dos pacotes instalados. Explique quantidade, tamanho total, pacotes grandes. É normal? É muito? Dê contexto.",
@@ -92,16 +416,16 @@ ESTRUTURA DO JSON:
     "analise_dependencies": "Análise de dependências. Há problemas? Pacotes duplicados? Como resolver?",
     
     "recomendacoes": [
-        {{
+        {
             "prioridade": "alta, media ou baixa",
             "titulo": "Título da recomendação",
             "descricao": "Explicação",
             "comandos": ["comando1"] ou null
-        }}
+        }
     ],
     
     "conclusao": "1-2 parágrafos resumindo o estado do sistema de pacotes e próximos passos"
-}}
+}
 
 REGRAS:
 
@@ -124,48 +448,191 @@ EXEMPLOS:
 
 Retorne APENAS o JSON válido, sem markdown."""
 
-    return prompt
+_DADOS_PREFIX = """DADOS DO SISTEMA:
+```json
+"""
+
+_DADOS_SUFFIX = """
+```"""
+
+# Prompt completo = _PROMPT_PREFIX + JSON + _DADOS_SUFFIX (montado uma vez, no import)
+_PROMPT_PREFIX = STATIC_INSTRUCTIONS + "\n\n" + _DADOS_PREFIX
+
+# Muda só quando o texto das instruções muda (ver --hash-prompt)
+STATIC_INSTRUCTIONS_SHA256 = hashlib.sha256(STATIC_INSTRUCTIONS.encode('utf-8')).hexdigest()
+
+
+def _serializar_json(dados_json):
+    """Serializa os dados para o prompt (orjson quando disponível)"""
+    if orjson is not None:
+        return orjson.dumps(dados_json, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(dados_json, indent=2, ensure_ascii=False)
+
+
+def resumir_dados(dados_json):
+    """Visão enxuta do relatório com só o que a análise usa
+    
+    A análise é sobre números agregados; listas longas (como os 100 maiores
+    pacotes) viram amostras pequenas, o que corta os tokens de entrada.
+    """
+    metrics = dados_json.get('metrics') or {}
+    packages_m = metrics.get('packages') or {}
+    updates_m = metrics.get('updates') or {}
+    orphans_m = metrics.get('orphans') or {}
+    deps_m = metrics.get('dependencies') or {}
+    
+    return {
+        "summary": dados_json.get('summary', {}),
+        "issues": dados_json.get('issues', []),
+        "packages": {
+            **(packages_m.get('summary') or {}),
+            # all_packages_sample já vem do maior para o menor
+            "top_packages_by_size": [
+                {"name": p.get('name'), "size_mb": p.get('size_mb'), "version": p.get('version')}
+                for p in (packages_m.get('all_packages_sample') or [])[:TOP_PACKAGES_PROMPT]
+            ]
+        },
+        "updates": {
+            "total_updates": updates_m.get('total_updates', 0),
+            "security_updates": updates_m.get('security_updates', 0),
+            "security_list": (updates_m.get('security_list') or [])[:SAMPLE_SIZE_PROMPT],
+            "updates_sample": (updates_m.get('updates_list') or [])[:SAMPLE_SIZE_PROMPT]
+        },
+        "orphans": {
+            "orphaned_count": orphans_m.get('orphaned_count', 0),
+            "autoremovable_count": orphans_m.get('autoremovable_count', 0),
+            "orphans_sample": [o.get('name') for o in (orphans_m.get('orphaned_packages') or [])[:SAMPLE_SIZE_PROMPT]]
+        },
+        "cache": metrics.get('cache') or {},
+        "dependencies": {
+            "broken_dependencies": deps_m.get('broken_dependencies', 0),
+            "duplicate_packages": deps_m.get('duplicate_packages', 0),
+            "broken_list": (deps_m.get('broken_list') or [])[:SAMPLE_SIZE_PROMPT],
+            "duplicate_list": (deps_m.get('duplicate_list') or [])[:SAMPLE_SIZE_PROMPT]
+        }
+    }
+
+
+def criar_prompt_analise(dados_json):
+    """Cria prompt completo (instruções + dados) para IA analisar pacotes"""
+    return "".join([_PROMPT_PREFIX, _serializar_json(resumir_dados(dados_json)), _DADOS_SUFFIX])
+
+
+class Card(BaseModel):
+    """Card de métrica do topo do relatório"""
+    icon: str
+    label: str
+    value: str
+    subtext: str
+
+
+class Recomendacao(BaseModel):
+    """Recomendação priorizada (prioridade: alta, media ou baixa)"""
+    prioridade: str
+    titulo: str
+    descricao: str
+    comandos: Optional[List[str]] = None
+
+
+class Analise(BaseModel):
+    """Estrutura da resposta do Gemini (aplicada como response_schema)"""
+    resumo_executivo: str
+    metricas_cards: List[Card]
+    analise_pacotes: str
+    analise_updates: str
+    analise_orphans: str
+    analise_cache: str
+    analise_dependencies: str
+    recomendacoes: List[Recomendacao]
+    conclusao: str
+
+
+class _ScannerJSON:
+    """Detecta, chunk a chunk, o fim do primeiro objeto JSON de nível superior
+    
+    Acompanha a profundidade de chaves fora de strings (respeitando escapes),
+    ignorando o que vier antes do primeiro `{` (ex.: cerca ```json).
+    """
+    
+    def __init__(self):
+        self.partes = []
+        self.profundidade = 0
+        self.em_string = False
+        self.escape = False
+        self.iniciado = False
+    
+    def feed(self, texto):
+        """Consome um chunk; retorna o texto do objeto quando ele se completa"""
+        if not self.iniciado:
+            inicio = texto.find('{')
+            if inicio == -1:
+                return None
+            self.iniciado = True
+            texto = texto[inicio:]
+        
+        for i, c in enumerate(texto):
+            if self.em_string:
+                if self.escape:
+                    self.escape = False
+                elif c == '\\':
+                    self.escape = True
+                elif c == '"':
+                    self.em_string = False
+            elif c == '"':
+                self.em_string = True
+            elif c == '{':
+                self.profundidade += 1
+            elif c == '}':
+                self.profundidade -= 1
+                if self.profundidade == 0:
+                    self.partes.append(texto[:i + 1])
+                    return "".join(self.partes)
+        
+        self.partes.append(texto)
+        return None
+
+
+def _config_geracao():
+    """Configuração de geração com saída estruturada no schema Analise"""
+    return types.GenerateContentConfig(
+        **GENERATION_CONFIG,
+        response_mime_type="application/json",
+        response_schema=Analise
+    )
 
 
 def chamar_gemini(prompt):
-    """Chama API Gemini"""
+    """Chama API Gemini
+    
+    A resposta chega em streaming e é varrida conforme chega: assim que o
+    objeto JSON fecha, a leitura para, sem esperar o fim da geração.
+    """
+    resultado = ""
     try:
         print("⏳ Analisando com Gemini...")
         
-        response = client.models.generate_content(
+        stream = obter_cliente().models.generate_content_stream(
             model=model,
             contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.7,
-                top_p=0.95,
-                max_output_tokens=8192
-            )
+            config=_config_geracao()
         )
         
-        resultado = response.text.strip()
-        
-        # Limpar markdown
-        json_text = resultado
-        if "```json" in resultado:
-            json_start = resultado.find("```json") + 7
-            json_end = resultado.find("```", json_start)
-            if json_end > json_start:
-                json_text = resultado[json_start:json_end].strip()
-        elif "```" in resultado:
-            json_start = resultado.find("```") + 3
-            json_end = resultado.rfind("```")
-            if json_end > json_start:
-                json_text = resultado[json_start:json_end].strip()
-        
-        # Extrair JSON
-        first_brace = json_text.find('{')
-        last_brace = json_text.rfind('}')
-        if first_brace != -1 and last_brace != -1:
-            json_text = json_text[first_brace:last_brace+1]
-        
-        return json.loads(json_text)
-        
-    except json.JSONDecodeError as e:
+        scanner = _ScannerJSON()
+        partes = []
+        json_text = None
+        for chunk in stream:
+            texto = chunk.text or ""
+            partes.append(texto)
+            json_text = scanner.feed(texto)
+            if json_text is not None:
+                break
+        
+        resultado = "".join(partes).strip()
+        
+        # Saída estruturada: o texto já é o JSON, sem cercas para remover
+        return Analise.model_validate_json(json_text or resultado).model_dump()
+    
+    except ValueError as e:
         print(f"⚠️ Erro ao parsear JSON: {e}")
         print("Resposta:", resultado[:500])
         return None
@@ -174,79 +641,233 @@ def chamar_gemini(prompt):
         return None
 
 
-def gerar_metrics_cards(metricas):
-    """Gera HTML dos cards de métricas"""
-    cards_html = ""
-    for m in metricas:
-        cards_html += f"""
+def analisar_com_gemini(dados_json):
+    """Analisa os dados com o prompt completo
+    
+    As instruções fixas vêm primeiro, para que o cache implícito do Gemini
+    reaproveite esse prefixo entre chamadas.
+    """
+    return chamar_gemini(criar_prompt_analise(dados_json))
+
+
+# Fragmentos HTML do relatório (formatados uma vez por item)
+_CARD_HTML = """
                     <div class="metric-card">
-                        <div class="icon">{m.get('icon', '📊')}</div>
-                        <div class="label">{m.get('label', 'Métrica')}</div>
-                        <div class="value">{m.get('value', 'N/A')}</div>
-                        <div class="subtext">{m.get('subtext', '')}</div>
+                        <div class="icon">{icon}</div>
+                        <div class="label">{label}</div>
+                        <div class="value">{value}</div>
+                        <div class="subtext">{subtext}</div>
                     </div>
 """
-    return cards_html
+
+# Blocos de texto da análise e o valor usado quando a IA não devolve algum
+_TEXTOS_PADRAO = dict.fromkeys([
+    "resumo_executivo",
+    "analise_pacotes",
+    "analise_updates",
+    "analise_orphans",
+    "analise_cache",
+    "analise_dependencies",
+    "conclusao"
+], "<p>N/A</p>")
+
+_RECOMENDACAO_HTML = '<li class="priority-{prioridade}">\n<strong>{titulo}</strong><br>\n{descricao}<br>\n'
+
+
+def _esc(valor, quote=False):
+    """Escapa texto vindo da IA antes de entrar no HTML"""
+    return escape(str(valor), quote=quote)
+
+
+def _remover_cercas(texto):
+    """Remove uma cerca de markdown (```json ... ```) em volta do JSON, se houver
+    
+    Com saída estruturada ela não deveria aparecer; só pontas da string são
+    verificadas, sem varrer a resposta inteira.
+    """
+    texto = texto.strip()
+    if texto.startswith("```json"):
+        texto = texto[7:]
+    elif texto.startswith("```"):
+        texto = texto[3:]
+    if texto.endswith("```"):
+        texto = texto[:-3]
+    return texto.strip()
+
+
+def _parse_analise(texto):
+    """Valida a resposta contra o schema Analise; None se inválida"""
+    try:
+        return Analise.model_validate_json(_remover_cercas(texto or "")).model_dump()
+    except ValueError as e:
+        print(f"⚠️ Erro ao parsear JSON: {e}")
+        return None
+
+
+async def _analisar_async(dados_json, semaforo):
+    """Uma análise pelo cliente assíncrono (mesmo prompt de `analisar_com_gemini`)"""
+    async with semaforo:
+        try:
+            response = await obter_cliente().aio.models.generate_content(
+                model=model,
+                contents=criar_prompt_analise(dados_json),
+                config=_config_geracao()
+            )
+            return _parse_analise(response.text)
+        except Exception as e:
+            print(f"❌ Erro ao chamar Gemini: {e}")
+            return None
+
+
+async def _analisar_varios(lista_dados):
+    """Dispara as análises em paralelo (limitadas por MAX_CONCURRENT_REQUESTS)
+    
+    As chamadas são quase só espera de rede, então sobrepô-las faz o tempo
+    total se aproximar do da chamada mais lenta.
+    """
+    semaforo = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    
+    return await asyncio.gather(*(
+        _analisar_async(dados, semaforo) for dados in lista_dados
+    ))
+
+
+def chamar_gemini_batch(lista_dados):
+    """Analisa vários snapshots de uma vez (backfill)
+    
+    Com REPORTER_TIER=flex (padrão) envia tudo em um único job da Batch API,
+    cobrado com desconto e consultado a cada BATCH_POLL_SECONDS; nos demais
+    tiers as chamadas são feitas em paralelo pelo cliente assíncrono. Retorna
+    uma análise (ou None) por item, na mesma ordem da entrada.
+    
+    Só a falha ao criar o lote cai direto nas chamadas normais. Depois que o
+    lote existe, erros de consulta são repetidos; se persistirem, o lote é
+    cancelado antes do fallback, para não pagar as mesmas análises duas vezes.
+    """
+    if REPORTER_TIER != "flex":
+        return asyncio.run(_analisar_varios(lista_dados))
+    
+    try:
+        job = obter_cliente().batches.create(
+            model=model,
+            src=[
+                types.InlinedRequest(contents=criar_prompt_analise(dados), config=_config_geracao())
+                for dados in lista_dados
+            ],
+            config=types.CreateBatchJobConfig(display_name="dnf-ai-analyzer-backfill")
+        )
+    except Exception as e:
+        print(f"⚠️ Erro ao criar o lote, analisando sem lote: {e}")
+        return asyncio.run(_analisar_varios(lista_dados))
+    
+    print(f"⏳ Lote {job.name} enviado ({len(lista_dados)} análises), aguardando...")
+    
+    falhas = 0
+    while job.state.name not in _ESTADOS_FINAIS_BATCH:
+        time.sleep(BATCH_POLL_SECONDS)
+        try:
+            job = obter_cliente().batches.get(name=job.name)
+            falhas = 0
+        except Exception as e:
+            falhas += 1
+            print(f"⚠️ Erro ao consultar o lote ({falhas}/{BATCH_MAX_POLL_ERRORS}): {e}")
+            if falhas < BATCH_MAX_POLL_ERRORS:
+                continue
+            
+            try:
+                obter_cliente().batches.cancel(name=job.name)
+            except Exception as e:
+                # Sem cancelar, o lote pode terminar e ser cobrado: não repetir as análises
+                print(f"❌ Não foi possível cancelar o lote {job.name}: {e}")
+                return [None] * len(lista_dados)
+            
+            print(f"⚠️ Lote {job.name} cancelado, analisando sem lote...")
+            return asyncio.run(_analisar_varios(lista_dados))
+    
+    if job.state.name != "JOB_STATE_SUCCEEDED":
+        print(f"❌ Lote terminou com estado {job.state.name}")
+        return [None] * len(lista_dados)
+    
+    resultados = []
+    for item in job.dest.inlined_responses:
+        if item.error or not item.response:
+            print(f"⚠️ Erro em item do lote: {item.error}")
+            resultados.append(None)
+            continue
+        
+        resultados.append(_parse_analise(item.response.text))
+    
+    # Completar se o lote devolveu menos respostas que pedidos
+    resultados.extend([None] * (len(lista_dados) - len(resultados)))
+    return resultados
+
+
+def gerar_metrics_cards(metricas):
+    """Gera HTML dos cards de métricas"""
+    parts = []
+    for m in metricas:
+        parts.append(_CARD_HTML.format(
+            icon=_esc(m.get('icon', '📊')),
+            label=_esc(m.get('label', 'Métrica')),
+            value=_esc(m.get('value', 'N/A')),
+            subtext=_esc(m.get('subtext', ''))
+        ))
+    return "".join(parts)
 
 
 def gerar_recomendacoes(recomendacoes):
     """Gera HTML das recomendações"""
-    html = '<ul class="recommendation-list">\n'
+    parts = ['<ul class="recommendation-list">\n']
     
     for rec in recomendacoes:
-        prioridade = rec.get('prioridade', 'media')
-        priority_class = f"priority-{prioridade}"
-        
-        html += f'<li class="{priority_class}">\n'
-        html += f'<strong>{rec.get("titulo", "Recomendação")}</strong><br>\n'
-        html += f'{rec.get("descricao", "")}<br>\n'
+        parts.append(_RECOMENDACAO_HTML.format(
+            # Vai dentro de um atributo: escapar aspas também
+            prioridade=_esc(rec.get('prioridade', 'media'), quote=True),
+            titulo=_esc(rec.get("titulo", "Recomendação")),
+            descricao=_esc(rec.get("descricao", ""))
+        ))
         
         if rec.get('comandos'):
-            html += '<pre><code>'
-            for cmd in rec['comandos']:
-                html += f'{cmd}\n'
-            html += '</code></pre>\n'
+            parts.append('<pre><code>')
+            parts.extend(f'{_esc(cmd)}\n' for cmd in rec['comandos'])
+            parts.append('</code></pre>\n')
         
-        html += '</li>\n'
+        parts.append('</li>\n')
     
-    html += '</ul>'
-    return html
+    parts.append('</ul>')
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=4)
+def _carregar_template(path, mtime):
+    """Lê o template; a mtime na chave faz uma edição no arquivo invalidar o cache"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
 
 
 def preencher_template(analise_json, dados_originais):
     """Preenche template HTML"""
-    template_path = Path(__file__).parent / "template.html"
+    template_path = str(Path(__file__).parent / "template.html")
     
     try:
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template = f.read()
+        template = _carregar_template(template_path, os.path.getmtime(template_path))
     except Exception as e:
         print(f"❌ Erro ao ler template: {e}")
         return None
     
-    # Substituir placeholders
-    template = template.replace('{{TIMESTAMP}}', dados_originais.get('timestamp', 'N/A'))
-    
-    # Métricas
+    # Métricas e recomendações
     metrics_html = gerar_metrics_cards(analise_json.get('metricas_cards', []))
-    template = template.replace('{{METRICS_CARDS}}', metrics_html)
-    
-    # Análises
-    template = template.replace('{{RESUMO_EXECUTIVO}}', analise_json.get('resumo_executivo', '<p>N/A</p>'))
-    template = template.replace('{{ANALISE_PACOTES}}', analise_json.get('analise_pacotes', '<p>N/A</p>'))
-    template = template.replace('{{ANALISE_UPDATES}}', analise_json.get('analise_updates', '<p>N/A</p>'))
-    template = template.replace('{{ANALISE_ORPHANS}}', analise_json.get('analise_orphans', '<p>N/A</p>'))
-    template = template.replace('{{ANALISE_CACHE}}', analise_json.get('analise_cache', '<p>N/A</p>'))
-    template = template.replace('{{ANALISE_DEPENDENCIES}}', analise_json.get('analise_dependencies', '<p>N/A</p>'))
-    
-    # Recomendações
     recomendacoes_html = gerar_recomendacoes(analise_json.get('recomendacoes', []))
-    template = template.replace('{{RECOMENDACOES}}', recomendacoes_html)
     
-    # Conclusão
-    template = template.replace('{{CONCLUSAO}}', analise_json.get('conclusao', '<p>N/A</p>'))
+    # Textos da análise: cada chave vira o placeholder em maiúsculas
+    view = {**_TEXTOS_PADRAO, **analise_json}
+    subs = {chave.upper(): view[chave] for chave in _TEXTOS_PADRAO}
+    subs["TIMESTAMP"] = dados_originais.get('timestamp', 'N/A')
+    subs["METRICS_CARDS"] = metrics_html
+    subs["RECOMENDACOES"] = recomendacoes_html
     
-    return template
+    # Substituir todos os placeholders em uma única passada; desconhecidos ficam como estão
+    return _PAT.sub(lambda m: subs.get(m.group(1), m.group(0)), template)
 
 
 def salvar_html(html_content, json_filepath):
@@ -268,20 +889,239 @@ def salvar_html(html_content, json_filepath):
 
 
 def abrir_no_navegador(filepath):
-    """Abre HTML no navegador"""
+    """Abre HTML no navegador (sem shell e sem esperar o navegador)"""
     try:
-        os.system(f"xdg-open '{filepath}'")
+        subprocess.Popen(
+            ["xdg-open", str(filepath)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
         return True
-    except:
+    except FileNotFoundError:
+        print("⚠️ xdg-open não encontrado")
+        return False
+    except OSError:
         return False
 
 
+def _formatar_numero(valor):
+    """Número com separador de milhar no padrão brasileiro (2.450)"""
+    return f"{valor:,}".replace(",", ".")
+
+
+def analise_trivial(dados_json):
+    """Análise gerada localmente quando não há nada pendente no sistema
+    
+    Sem atualizações, problemas ou órfãos a resposta do Gemini seria um texto
+    padrão; nesse caso o relatório é montado direto dos contadores, sem custo
+    nem espera. O problema do tipo "cache" não conta: ele vira a recomendação
+    de limpeza. Retorna None se houver qualquer outra pendência ou se a coleta
+    falhou (nenhum pacote ou algum coletor com erro), para não apresentar uma
+    coleta incompleta como sistema em dia.
+    """
+    summary = dados_json.get('summary', {})
+    metrics = dados_json.get('metrics') or {}
+    orphans_m = metrics.get('orphans') or {}
+    
+    if not summary.get('total_packages', 0):
+        return None
+    if any(isinstance(secao, dict) and 'error' in secao for secao in metrics.values()):
+        return None
+    
+    problemas_cache = sum(1 for i in dados_json.get('issues', []) if i.get('type') == 'cache')
+    problemas = (summary.get('total_issues', 0) or 0) - problemas_cache
+    
+    if (summary.get('total_updates', 0) or problemas > 0
+            or orphans_m.get('orphaned_count', 0) or orphans_m.get('autoremovable_count', 0)):
+        return None
+    
+    packages_s = (metrics.get('packages') or {}).get('summary') or {}
+    cache_m = metrics.get('cache') or {}
+    
+    total = _formatar_numero(summary.get('total_packages', 0))
+    usuario = _formatar_numero(packages_s.get('user_installed', 0))
+    tamanho_gb = packages_s.get('total_size_gb', 0)
+    cache_mb = summary.get('cache_size_mb', 0) or 0
+    limpar_cache = cache_m.get('can_clean', False)
+    
+    recomendacoes = []
+    if limpar_cache:
+        recomendacoes.append({
+            "prioridade": "media",
+            "titulo": "Limpar o cache do DNF",
+            "descricao": f"O cache ocupa {cache_mb:.0f} MB com pacotes já instalados. Eles podem ser removidos com segurança; o DNF baixa de novo o que precisar.",
+            "comandos": ["sudo dnf clean packages"]
+        })
+    recomendacoes.append({
+        "prioridade": "baixa",
+        "titulo": "Manter a rotina de atualizações",
+        "descricao": "Nada a fazer agora. Continue verificando atualizações periodicamente para manter o sistema em dia.",
+        "comandos": ["sudo dnf upgrade --refresh"]
+    })
+    
+    return {
+        "resumo_executivo": (
+            f"<p>Seu sistema tem {total} pacotes instalados, ocupando {tamanho_gb} GB, e está em dia: "
+            "nenhuma atualização pendente, nenhum pacote órfão e nenhum problema de dependências.</p>"
+            + ("<p>A única sugestão é limpar o cache do DNF, que pode liberar espaço.</p>" if limpar_cache
+               else "<p>Não há nenhuma ação necessária no momento.</p>")
+        ),
+        "metricas_cards": [
+            {"icon": "📦", "label": "Pacotes instalados", "value": total, "subtext": f"{usuario} instalados por você"},
+            {"icon": "💽", "label": "Espaço ocupado", "value": f"{tamanho_gb} GB", "subtext": "Soma de todos os pacotes"},
+            {"icon": "✅", "label": "Atualizações", "value": "0", "subtext": "Sistema atualizado"},
+            {"icon": "🗄️", "label": "Cache do DNF", "value": f"{cache_mb:.0f} MB", "subtext": "Pode ser limpo" if limpar_cache else "Tamanho normal"}
+        ],
+        "analise_pacotes": f"<p>São {total} pacotes, {usuario} deles instalados explicitamente por você e o restante como dependências, somando {tamanho_gb} GB.</p>",
+        "analise_updates": "<p>Todos os pacotes estão na versão mais recente disponível nos repositórios, incluindo as correções de segurança.</p>",
+        "analise_orphans": "<p>Nenhum pacote órfão: todas as dependências instaladas ainda são usadas por algum pacote.</p>",
+        "analise_cache": (
+            f"<p>O cache do DNF ocupa {cache_mb:.0f} MB"
+            + (", acima de 100 MB; vale limpar os pacotes já baixados.</p>" if limpar_cache else ", um tamanho normal.</p>")
+        ),
+        "analise_dependencies": "<p>Nenhuma dependência quebrada ou pacote duplicado foi encontrado.</p>",
+        "recomendacoes": recomendacoes,
+        "conclusao": "<p>O sistema de pacotes está limpo e atualizado. Rode a análise novamente depois das próximas atualizações.</p>"
+    }
+
+
+def obter_analise(dados_json):
+    """Análise de um snapshot: local se não houver pendências, senão do cache ou do Gemini"""
+    analise_json = analise_trivial(dados_json)
+    if analise_json:
+        print("\n✨ Nada pendente no sistema: análise gerada localmente, sem chamar o Gemini")
+        return analise_json
+    
+    # Reaproveitar análise de uma entrada idêntica
+    cache = LLMCache(CACHE_DIR)
+    cache_key = cache.cache_key(dados_json)
+    analise_json = cache.get(cache_key)
+    
+    # Sem resultado exato: procurar um snapshot quase idêntico
+    semantic_cache = SemanticCache(CACHE_DIR)
+    if not analise_json:
+        analise_json = semantic_cache.get(dados_json)
+    
+    if analise_json:
+        print("\n♻️  Análise reaproveitada do cache")
+    else:
+        # Chamar IA
+        print("\n🧠 Preparando análise...")
+        analise_json = analisar_com_gemini(dados_json)
+        
+        if analise_json:
+            cache.set(cache_key, analise_json)
+            semantic_cache.set(dados_json, cache_key)
+            print("✅ Análise concluída!")
+    
+    print(f"   Cache: {cache.hits} hit(s), {cache.misses} miss(es)")
+    if np is not None:
+        print(f"   Cache semântico: {semantic_cache.hits} hit(s), {semantic_cache.misses} miss(es)")
+    
+    return analise_json
+
+
+def regerar_historico(quantidade):
+    """Regera os relatórios dos últimos snapshots sem interação (backfill)"""
+    json_files = obter_ultimos_jsons(quantidade)
+    if not json_files:
+        return False
+    
+    print(f"📂 {len(json_files)} relatório(s) para processar")
+    
+    cache = LLMCache(CACHE_DIR)
+    semantic_cache = SemanticCache(CACHE_DIR)
+    prontos = []
+    pendentes = []
+    
+    for json_file in json_files:
+        dados = ler_json(json_file)
+        if not dados:
+            continue
+        
+        analise_json = analise_trivial(dados)
+        if analise_json:
+            prontos.append((json_file, dados, analise_json))
+            continue
+        
+        cache_key = cache.cache_key(dados)
+        analise_json = cache.get(cache_key) or semantic_cache.get(dados)
+        
+        if analise_json:
+            prontos.append((json_file, dados, analise_json))
+        else:
+            pendentes.append((json_file, dados, cache_key))
+    
+    if pendentes:
+        print(f"\n🧠 Analisando {len(pendentes)} snapshot(s) com Gemini...")
+        resultados = chamar_gemini_batch([dados for _, dados, _ in pendentes])
+        
+        for (json_file, dados, cache_key), analise_json in zip(pendentes, resultados):
+            if not analise_json:
+                print(f"❌ Falha na análise de {json_file.name}")
+                continue
+            
+            cache.set(cache_key, analise_json)
+            semantic_cache.set(dados, cache_key)
+            prontos.append((json_file, dados, analise_json))
+    
+    print(f"   Cache: {cache.hits} hit(s), {cache.misses} miss(es)")
+    
+    gerados = 0
+    for json_file, dados, analise_json in prontos:
+        html_content = preencher_template(analise_json, dados)
+        html_file = salvar_html(html_content, json_file) if html_content else None
+        if html_file:
+            print(f"✅ {json_file.name} → {html_file}")
+            gerados += 1
+    
+    print(f"\n✨ {gerados}/{len(json_files)} relatório(s) gerado(s)")
+    return gerados == len(json_files)
+
+
 def main():
     """Função principal"""
+    parser = argparse.ArgumentParser(
+        description='AI Package Reporter - Relatórios de pacotes com Gemini'
+    )
+    parser.add_argument(
+        '--ultimos',
+        type=int,
+        metavar='N',
+        help='Regera os relatórios dos N snapshots mais recentes, sem interação',
+        default=None
+    )
+    parser.add_argument(
+        '--hash-prompt',
+        action='store_true',
+        help='Mostra o SHA256 das instruções fixas do prompt e sai'
+    )
+    
+    args = parser.parse_args()
+    
+    if args.hash_prompt:
+        # Deve ser igual entre execuções para o cache de contexto do Gemini ser reaproveitado
+        print(STATIC_INSTRUCTIONS_SHA256)
+        sys.exit(0)
+    
+    # Falhar cedo se faltar a chave, antes de procurar e ler relatórios
+    obter_cliente()
+    
     print("📦 AI Package Reporter - Análise Inteligente de Pacotes")
     print("🤖 Powered by Google Gemini")
     print()
     
+    if args.ultimos is not None:
+        if args.ultimos < 1:
+            parser.error("--ultimos precisa ser maior que zero")
+        try:
+            sys.exit(0 if regerar_historico(args.ultimos) else 1)
+        except KeyboardInterrupt:
+            print("\n\n⚠️ Interrompido!")
+            sys.exit(130)
+    
     try:
         # Obter JSON
         print("📂 Procurando relatórios...")
@@ -307,19 +1147,12 @@ def main():
         print(f"   Atualizações: {summary.get('total_updates', 0)}")
         print(f"   Problemas: {summary.get('total_issues', 0)}")
         
-        # Criar prompt
-        print("\n🧠 Preparando análise...")
-        prompt = criar_prompt_analise(dados)
-        
-        # Chamar IA
-        analise_json = chamar_gemini(prompt)
+        analise_json = obter_analise(dados)
         
         if not analise_json:
             print("❌ Falha na análise")
             sys.exit(1)
         
-        print("✅ Análise concluída!")
-        
         # Preencher template
         print("🎨 Gerando HTML...")
         html_content = preencher_template(analise_json, dados)
@@ -354,7 +1187,7 @@ def main():
                 break
         
         print("\n👋 Concluído!")
-        
+    
     except KeyboardInterrupt:
         print("\n\n⚠️ Interrompido!")
         sys.exit(130)